@@ -5,8 +5,13 @@ import math
 from dotenv import load_dotenv, find_dotenv
 
 from ToolCalling.helper import Tool, validate_arguments, tool
+from ToolCalling.retrieval import ToolIndex
+from ToolCalling.speculation import ToolSpeculator
 from utils.completions import build_prompt_structure, ChatHistory, completions_create, update_chat_history
 from utils.extraction import extract_tag_content
+from utils.observation_store import ObservationStore
+from utils.semantic_cache import SemanticCache, context_key
+from utils.singleflight import coalesced_completions_create
 
 
 _ = load_dotenv(find_dotenv())
@@ -61,25 +66,91 @@ class ReactAgent:
         model: The name of the model used for generating responses.
         tools: A list of Tool instances available for execution.
         tools_dict: A dictionary mapping toll names to their corresponding Tool instances.
+        semantic_cache: An optional SemanticCache serving previous answers to near-duplicate user messages.
+        top_k_tools: If set, only the signatures of the top-k tools relevant to the user message are sent.
+        tool_index: The ToolIndex used to pick those tools, or None when every signature is sent.
+        observation_store: An optional ObservationStore holding large tool results out of the chat history.
+        speculator: If speculation is enabled, the ToolSpeculator prefetching likely calls of side-effect-free
+                    tools while the LLM is thinking. None otherwise.
+        coalesce: Whether identical in-flight requests from concurrent sessions share one provider call.
     """
 
     def __init__(self,
                  tools: Tool | list[Tool],
                  model: str = "openai:gpt-4o-mini",
-                 system_prompt: str = BASE_SYSTEM_PROMPT, ):
+                 system_prompt: str = BASE_SYSTEM_PROMPT,
+                 semantic_cache: SemanticCache | None = None,
+                 top_k_tools: int | None = None,
+                 observation_store: ObservationStore | None = None,
+                 speculate: bool = False,
+                 coalesce: bool = False):
         self.client = ai.Client()
         self.model = model
         self.system_prompt = system_prompt
         self.tools = tools if isinstance(tools, list) else [tools]
-        self.tools_dict = {tool.name: tool for tool in tools}
+        self.observation_store = observation_store
+        if observation_store is not None:
+            self.tools = self.tools + [observation_store.as_tool()]
+            self.observation_tool_name = self.tools[-1].name
+        self.tools_dict = {tool.name: tool for tool in self.tools}
+        self.semantic_cache = semantic_cache
+        self.top_k_tools = top_k_tools
+        self.tool_index = ToolIndex(self.tools) if top_k_tools is not None else None
+        # Tools are looked up at call time, so tools swapped later (e.g. by a SessionReplayer) are honoured
+        self.speculator = ToolSpeculator(lambda: self.tools_dict) if speculate else None
+        self.coalesce = coalesce
+
+    def close(self):
+        """
+        Releases the background workers of the speculator, if speculation is enabled.
+        """
+        if self.speculator is not None:
+            self.speculator.close()
+
+    def _request_completion(self, history: list) -> str:
+        """
+        A private method to request a completion from the LLM model.
+
+        :param history: A list of messages forming the conversation history.
+
+        :return: The model generated response.
+        """
+        create = coalesced_completions_create if self.coalesce else completions_create
+        return create(self.client, history, self.model)
+
+    def add_tool_signatures(self, tools: list[Tool] | None = None) -> str:
+        """
+        Collects the function signatures of the given tools.
 
-    def add_tool_signatures(self) -> str:
+        :param tools: The tools to collect the signatures of. Defaults to all available tools.
+
+        :return: A string containing the function signatures of the tools in JSON format.
         """
-        Collects the function signatures of all available tools.
+        tools = self.tools if tools is None else tools
+        return "".join([tool.fn_signature for tool in tools])
 
-        :return: A string containing the function signatures of all tools in JSON format.
+    def select_tools(self, user_msg: str) -> list[Tool]:
         """
-        return "".join([tool.fn_signature for tool in self.tools])
+        Picks the tools whose signatures are exposed to the model for a given user message.
+
+        :param user_msg: The user's message.
+
+        :return: The top-k relevant tools if tool retrieval is enabled, all available tools otherwise.
+        """
+        if self.tool_index is None:
+            return self.tools
+        return self.tool_index.search(user_msg, self.top_k_tools)
+
+    def has_unknown_tool_call(self, tool_calls_content: list) -> bool:
+        """
+        Checks whether the model asked for a tool that isn't registered, which happens when the relevant tool
+        was left out of the prompt.
+
+        :param tool_calls_content: List of strings, each representing a tool call in JSON format.
+
+        :return: True if any tool call names an unregistered tool.
+        """
+        return any(json.loads(tool_call_str)["name"] not in self.tools_dict for tool_call_str in tool_calls_content)
 
     def process_tool_calls(self, tool_calls_content: list) -> dict:
         """
@@ -103,9 +174,17 @@ class ReactAgent:
             )
             print(Fore.GREEN + f"\nTool Call dict: \n{validated_tool_call}")
 
-            result = tool.run(**validated_tool_call["arguments"])
+            if self.speculator is not None:
+                result = self.speculator.run(tool, validated_tool_call["arguments"])
+            else:
+                result = tool.run(**validated_tool_call["arguments"])
             print(Fore.GREEN + f"\nTool Result: \n{result}")
 
+            # Large results only leave a preview and a handle in the chat history. Pages read back from the
+            # store are kept whole, otherwise the model could never get past the preview
+            if self.observation_store is not None and tool_name != self.observation_tool_name:
+                result = self.observation_store.externalize(result)
+
             # Store the result using the tool call ID
             observations[validated_tool_call["id"]] = result
         return observations
@@ -123,27 +202,56 @@ class ReactAgent:
 
         :return: The final output generated by the agent after processing user input and any tool calls.
         """
+        if self.semantic_cache is not None:
+            # Answers are only shared between agents with the same model, prompt and tools
+            cache_context = context_key(self.model, self.system_prompt, self.add_tool_signatures())
+            cached_response = self.semantic_cache.get(user_msg, cache_context)
+            if cached_response is not None:
+                return cached_response
+
         user_prompt = build_prompt_structure(prompt=user_msg, role="user", tag="question")
 
+        exposed_tools = self.select_tools(user_msg)
+        system_prompt = self.system_prompt
         if self.tools:
-            self.system_prompt += (
-                    "\n" + REACT_SYSTEM_PROMPT % self.add_tool_signatures()
+            system_prompt += (
+                    "\n" + REACT_SYSTEM_PROMPT % self.add_tool_signatures(exposed_tools)
             )
         chat_history = ChatHistory([
-            build_prompt_structure(prompt=self.system_prompt,
+            build_prompt_structure(prompt=system_prompt,
                                    role="system"),
             user_prompt
         ])
 
+        final_response = None
+        if self.speculator is not None:
+            self.speculator.start_session()
         if self.tools:
             for _ in range(max_rounds):
-                completion = completions_create(self.client, messages=chat_history, model=self.model)
+                # Likely tool calls run in the background while the LLM is thinking
+                if self.speculator is not None:
+                    self.speculator.prefetch()
+                if self.tool_index is not None:
+                    self.tool_index.record_prompt(exposed_tools)
+                completion = self._request_completion(chat_history)
                 response = extract_tag_content(str(completion), "response")
                 if response.found:
-                    return response.content[0]
+                    final_response = response.content[0]
+                    break
                 thought = extract_tag_content(str(completion), "thought")
                 tool_calls = extract_tag_content(str(completion), "tool_call")
 
+                if (tool_calls.found and len(exposed_tools) < len(self.tools)
+                        and self.has_unknown_tool_call(tool_calls.content)):
+                    # The relevant tool was left out of the prompt: expose the whole catalog and redo the round
+                    self.tool_index.record_fallback()
+                    exposed_tools = self.tools
+                    chat_history[0] = build_prompt_structure(
+                        prompt=self.system_prompt + "\n" + REACT_SYSTEM_PROMPT % self.add_tool_signatures(),
+                        role="system"
+                    )
+                    continue
+
                 update_chat_history(chat_history, completion, "assistant")
                 print(Fore.MAGENTA + f"\nThought: {thought.content[0]}")
 
@@ -151,8 +259,15 @@ class ReactAgent:
                     observations = self.process_tool_calls(tool_calls.content)
                     print(Fore.BLUE + f"\nObservations: {observations}")
                     update_chat_history(chat_history, f"{observations}", "user")
+                    if self.speculator is not None:
+                        self.speculator.end_round()
+
+        if final_response is None:
+            final_response = self._request_completion(chat_history)
 
-        return completions_create(self.client, messages=chat_history, model=self.model)
+        if self.semantic_cache is not None:
+            self.semantic_cache.put(user_msg, final_response, cache_context)
+        return final_response
 
 
 if __name__ == "__main__":
@@ -5,6 +5,7 @@ from colorama import Fore
 from utils.completions import (completions_create, FixedFirstChatHistory, build_prompt_structure,
                                update_chat_history)
 from utils.logging import fancy_step_tracker
+from utils.singleflight import coalesced_completions_create
 
 _ = load_dotenv(find_dotenv())
 
@@ -31,11 +32,13 @@ class ReflectionAgent:
     Attributes:
         model: The model name used for generating and reflecting on responses.
         client: An instance of the LLM client to interact with the language model.
+        coalesce: Whether identical in-flight requests from concurrent sessions share one provider call.
     """
 
-    def __init__(self, model: str = "openai:gpt-4o-mini"):
+    def __init__(self, model: str = "openai:gpt-4o-mini", coalesce: bool = False):
         self.client = ai.Client()
         self.model = model
+        self.coalesce = coalesce
 
     def _request_completion(self, history: list, verbose: int = 0, log_title: str = "COMPLETION",
                             log_color: str = "", ):
@@ -47,7 +50,8 @@ class ReflectionAgent:
 
         :return: The model generated response.
         """
-        output = completions_create(self.client, history, self.model)
+        create = coalesced_completions_create if self.coalesce else completions_create
+        output = create(self.client, history, self.model)
 
         if verbose > 0:
             print(log_color, f"\n\n{log_title}\n\n", output)
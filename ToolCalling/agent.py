@@ -3,9 +3,12 @@ import aisuite as ai
 from colorama import Fore
 from dotenv import load_dotenv, find_dotenv
 
-from helper import Tool, validate_arguments
+from ToolCalling.helper import Tool, validate_arguments
+from ToolCalling.retrieval import ToolIndex
 from utils.completions import build_prompt_structure, ChatHistory, completions_create, update_chat_history
 from utils.extraction import extract_tag_content
+from utils.semantic_cache import SemanticCache, context_key
+from utils.singleflight import coalesced_completions_create
 
 
 _ = load_dotenv(find_dotenv())
@@ -40,23 +43,71 @@ class ToolAgent:
         model: The model to be used for generating tool calls and responses.
         client: The LLM model client used to interact with the language model.
         tools_dict: A dictionary mapping tool names to their corresponding Tool objects.
+        semantic_cache: An optional SemanticCache serving previous answers to near-duplicate user messages.
+        top_k_tools: If set, only the signatures of the top-k tools relevant to the user message are sent.
+        tool_index: The ToolIndex used to pick those tools, or None when every signature is sent.
+        coalesce: Whether identical in-flight requests from concurrent sessions share one provider call.
     """
 
     def __init__(self,
                  tools: Tool | list[Tool],
-                 model: str = "openai:gpt-4o-mini"):
+                 model: str = "openai:gpt-4o-mini",
+                 semantic_cache: SemanticCache | None = None,
+                 top_k_tools: int | None = None,
+                 coalesce: bool = False):
         self.client = ai.Client()
         self.model = model
         self.tools = tools if isinstance(tools, list) else [tools]
         self.tools_dict = {tool.name: tool for tool in self.tools}
+        self.semantic_cache = semantic_cache
+        self.top_k_tools = top_k_tools
+        self.tool_index = ToolIndex(self.tools) if top_k_tools is not None else None
+        self.coalesce = coalesce
 
-    def add_tool_signature(self):
+    def _request_completion(self, history: list) -> str:
         """
-        Collects the function signatures of all available tools.
+        A private method to request a completion from the LLM model.
 
-        :return: A concatenated string of all tool function signatures in JSON format.
+        :param history: A list of messages forming the conversation history.
+
+        :return: The model generated response.
+        """
+        create = coalesced_completions_create if self.coalesce else completions_create
+        return create(self.client, history, self.model)
+
+    def add_tool_signature(self, tools: list[Tool] | None = None):
+        """
+        Collects the function signatures of the given tools.
+
+        :param tools: The tools to collect the signatures of. Defaults to all available tools.
+
+        :return: A concatenated string of the tool function signatures in JSON format.
+        """
+        tools = self.tools if tools is None else tools
+        return "".join([tool.fn_signature for tool in tools])
+
+    def select_tools(self, user_msg: str) -> list[Tool]:
         """
-        return "".join([tool.fn_signature for tool in self.tools])
+        Picks the tools whose signatures are exposed to the model for a given user message.
+
+        :param user_msg: The user's message.
+
+        :return: The top-k relevant tools if tool retrieval is enabled, all available tools otherwise.
+        """
+        if self.tool_index is None:
+            return self.tools
+        return self.tool_index.search(user_msg, self.top_k_tools)
+
+    def has_unknown_tool_call(self, tool_calls_content: list) -> bool:
+        """
+        Checks whether the model asked for a tool that isn't registered, which happens when the relevant tool
+        was left out of the prompt.
+
+        :param tool_calls_content: List of strings, each representing a tool call in JSON format.
+
+        :return: True if any tool call names an unregistered tool.
+        """
+        return any(json.loads(tool_call_str)["name"] not in self.tools_dict for tool_call_str in tool_calls_content)
 
     def process_tool_calls(self, tool_calls_content: list) -> dict:
         """
@@ -97,27 +148,46 @@ class ToolAgent:
 
         :return: The final output after executing the tool and generating a response from the model.
         """
+        if self.semantic_cache is not None:
+            # Answers are only shared between agents with the same model, prompt and tools
+            cache_context = context_key(self.model, self.add_tool_signature())
+            cached_response = self.semantic_cache.get(user_msg, cache_context)
+            if cached_response is not None:
+                return cached_response
+
         user_prompt = build_prompt_structure(prompt=user_msg, role="user")
 
+        exposed_tools = self.select_tools(user_msg)
         tool_chat_history = ChatHistory([
-            build_prompt_structure(prompt=TOOL_SYSTEM_PROMPT % self.add_tool_signature(),
+            build_prompt_structure(prompt=TOOL_SYSTEM_PROMPT % self.add_tool_signature(exposed_tools),
                                    role="system"),
             user_prompt
         ])
         agent_chat_history = ChatHistory([user_prompt])
 
-        tool_call_response = completions_create(
-            self.client, messages=tool_chat_history, model=self.model
-        )
+        if self.tool_index is not None:
+            self.tool_index.record_prompt(exposed_tools)
+        tool_call_response = self._request_completion(tool_chat_history)
         tool_calls = extract_tag_content(str(tool_call_response), "tool_call")
 
+        if tool_calls.found and len(exposed_tools) < len(self.tools) and self.has_unknown_tool_call(tool_calls.content):
+            # The relevant tool was left out of the prompt: ask again with the whole catalog
+            self.tool_index.record_fallback()
+            tool_chat_history[0] = build_prompt_structure(prompt=TOOL_SYSTEM_PROMPT % self.add_tool_signature(),
+                                                          role="system")
+            tool_call_response = self._request_completion(tool_chat_history)
+            tool_calls = extract_tag_content(str(tool_call_response), "tool_call")
+
         if tool_calls.found:
             observations = self.process_tool_calls(tool_calls.content)
             update_chat_history(
                 agent_chat_history, f'f"Observation: {observations}"', "user"
             )
 
-        return completions_create(self.client, agent_chat_history, self.model)
+        response = self._request_completion(agent_chat_history)
+        if self.semantic_cache is not None:
+            self.semantic_cache.put(user_msg, response, cache_context)
+        return response
 
 
 if __name__ == "__main__":
@@ -132,7 +202,7 @@ if __name__ == "__main__":
         """
         return x + y
 
-    from helper import tool
+    from ToolCalling.helper import tool
     add_tool = tool(add)
     tool_agent = ToolAgent(tools=[add_tool])
 
@@ -56,12 +56,15 @@ class Tool:
           name: The name of the tool (function).
           fn: The function that the tool represents.
           fn_signature: JSON string representation of the function's signature.
+          side_effect_free: Whether the function only computes its result, so it's safe to run it speculatively
+                            or reuse its result for identical arguments.
     """
 
-    def __init__(self, name: str, fn: Callable, fn_signature: str):
+    def __init__(self, name: str, fn: Callable, fn_signature: str, side_effect_free: bool = False):
         self.name = name
         self.fn = fn
         self.fn_signature = fn_signature
+        self.side_effect_free = side_effect_free
 
     def __str__(self):
         return self.fn_signature
@@ -77,18 +80,24 @@ class Tool:
         return self.fn(**kwargs)
 
 
-def tool(fn: Callable):
+def tool(fn: Callable | None = None, *, side_effect_free: bool = False):
     """
-    A decorator that wraps a function into a Tool object.
+    A decorator that wraps a function into a Tool object. It can be used as `@tool` or, to mark the function
+    as side-effect-free, as `@tool(side_effect_free=True)`.
 
     :param fn: The function to be wrapped.
+    :param side_effect_free: Whether the function only computes its result.
 
     :return: A Tool object containing the function, its name, and its signature.
     """
-    def wrapper():
+    def wrapper(fn: Callable):
         fn_signature = get_fn_signature(fn)
         return Tool(name=fn_signature.get("name"),
                     fn=fn,
-                    fn_signature=json.dumps(fn_signature))
-    return wrapper()
+                    fn_signature=json.dumps(fn_signature),
+                    side_effect_free=side_effect_free)
+
+    if fn is None:
+        return wrapper
+    return wrapper(fn)
 
@@ -0,0 +1,139 @@
+import json
+import math
+import re
+import threading
+from collections import Counter
+
+from ToolCalling.helper import Tool
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Splits a text into lowercase alphanumeric terms. Tool names like 'get_current_weather' are split on the
+    underscores, so their words match the words of a user query.
+
+    :param text: The text to tokenize.
+
+    :return: A list of terms.
+    """
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimates the number of prompt tokens of a text with the usual ~4 characters per token rule.
+
+    :param text: The text to measure.
+
+    :return: The estimated number of tokens.
+    """
+    return math.ceil(len(text) / 4)
+
+
+class ToolIndex:
+    """
+    A BM25 index over tool names and descriptions, built once when the tools are registered. It's used to expose
+    only the top-k tools relevant to a query in the system prompt instead of the whole catalog.
+
+    Attributes:
+        tools: The indexed tools, in registration order.
+        k1: The BM25 term frequency saturation parameter.
+        b: The BM25 document length normalization parameter.
+        prompts: The number of prompts built with a subset of the tools.
+        fallbacks: The number of times the full tool set had to be exposed because the model asked for a tool
+                   it hadn't been shown.
+        prompt_tokens_saved: The estimated number of prompt tokens saved over every recorded prompt.
+    """
+
+    def __init__(self, tools: list[Tool], k1: float = 1.5, b: float = 0.75):
+        self.tools = tools
+        self.k1 = k1
+        self.b = b
+        self.prompts = 0
+        self.fallbacks = 0
+        self.prompt_tokens_saved = 0
+        self._lock = threading.Lock()
+
+        self._term_freqs = []
+        for tool in tools:
+            signature = json.loads(tool.fn_signature)
+            terms = tokenize(tool.name) + tokenize(signature.get("description") or "")
+            self._term_freqs.append(Counter(terms))
+
+        self._lengths = [sum(term_freqs.values()) for term_freqs in self._term_freqs]
+        self._avg_length = (sum(self._lengths) / len(self._lengths)) if tools else 0.0
+        document_freqs = Counter(term for term_freqs in self._term_freqs for term in term_freqs)
+        n_docs = len(tools)
+        self._idf = {
+            term: math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            for term, df in document_freqs.items()
+        }
+        self._signature_tokens = {tool.name: estimate_tokens(tool.fn_signature) for tool in tools}
+        self._full_tokens = sum(self._signature_tokens.values())
+
+    def score(self, query: str) -> list[float]:
+        """
+        Scores every indexed tool against a query with BM25.
+
+        :param query: The user query.
+
+        :return: A list with the score of each tool, in registration order.
+        """
+        query_terms = set(tokenize(query))
+        scores = []
+        for term_freqs, length in zip(self._term_freqs, self._lengths):
+            norm = self.k1 * (1 - self.b + self.b * length / self._avg_length) if self._avg_length else self.k1
+            score = 0.0
+            for term in query_terms:
+                tf = term_freqs.get(term, 0)
+                if tf:
+                    score += self._idf[term] * tf * (self.k1 + 1) / (tf + norm)
+            scores.append(score)
+        return scores
+
+    def search(self, query: str, k: int) -> list[Tool]:
+        """
+        Picks the k tools most relevant to a query.
+
+        :param query: The user query.
+        :param k: The number of tools to return.
+
+        :return: The top-k tools, kept in registration order so the prompt stays stable across similar queries.
+        """
+        if k >= len(self.tools):
+            return list(self.tools)
+        scores = self.score(query)
+        top = sorted(range(len(self.tools)), key=lambda i: scores[i], reverse=True)[:k]
+        return [self.tools[i] for i in sorted(top)]
+
+    def record_prompt(self, exposed_tools: list[Tool]):
+        """
+        Records that a prompt was sent with only some of the tool signatures.
+
+        :param exposed_tools: The tools whose signatures were included in the prompt.
+        """
+        exposed_tokens = sum(self._signature_tokens[tool.name] for tool in exposed_tools)
+        with self._lock:
+            self.prompts += 1
+            self.prompt_tokens_saved += self._full_tokens - exposed_tokens
+
+    def record_fallback(self):
+        """
+        Records that the model asked for a tool it hadn't been shown and the full tool set was exposed instead.
+        """
+        with self._lock:
+            self.fallbacks += 1
+
+    def stats(self) -> dict:
+        """
+        Collects the retrieval counters.
+
+        :return: A dictionary with the number of prompts, fallbacks and the estimated prompt tokens saved.
+        """
+        with self._lock:
+            return {
+                "prompts": self.prompts,
+                "fallbacks": self.fallbacks,
+                "prompt_tokens_saved": self.prompt_tokens_saved,
+                "avg_prompt_tokens_saved": self.prompt_tokens_saved / self.prompts if self.prompts else 0.0,
+            }
@@ -0,0 +1,190 @@
+import json
+import threading
+from collections import Counter, OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable
+
+from ToolCalling.helper import Tool
+
+# The calls of the first round of a session are learned as following this pseudo call
+_SESSION_START = "__start__"
+
+
+def call_key(tool_name: str, arguments: dict) -> str:
+    """
+    Builds a key identifying a tool call, so identical calls map to the same key.
+
+    :param tool_name: The name of the tool.
+    :param arguments: The validated arguments of the call.
+
+    :return: A string identifying the call.
+    """
+    return json.dumps([tool_name, arguments], sort_keys=True, default=str)
+
+
+class ToolSpeculator:
+    """
+    Runs likely tool calls in the background while the LLM is thinking, so a ReactAgent round doesn't have to wait
+    for the tools once the model asks for them.
+
+    Which calls follow which is learned from the rounds of previous sessions and of the current one. Only tools
+    marked as side-effect-free are ever run speculatively, and their results are reused for identical calls within
+    a session.
+
+    Attributes:
+        get_tools: A function returning the dictionary mapping tool names to Tool instances. It's called every time
+                   a tool is resolved, so tools swapped on the agent afterwards (e.g. by SessionRecorder or
+                   SessionReplayer) are the ones run.
+        max_predictions: The maximum number of calls started speculatively per round.
+        max_transitions: The maximum number of calls whose successors are remembered, least recently seen first
+                         forgotten.
+        max_successors: The maximum number of successors remembered per call.
+        lookups: The number of side-effect-free tool calls requested by the model.
+        hits: The number of those calls served from a speculative run.
+        reuses: The number of those calls served from an identical call made earlier in the session.
+        speculated: The number of calls started speculatively.
+    """
+
+    def __init__(self, get_tools: Callable[[], dict[str, Tool]], max_predictions: int = 4, max_workers: int = 4,
+                 max_transitions: int = 1024, max_successors: int = 32):
+        self.get_tools = get_tools
+        self.max_predictions = max_predictions
+        self.max_transitions = max_transitions
+        self.max_successors = max_successors
+        self.lookups = 0
+        self.hits = 0
+        self.reuses = 0
+        self.speculated = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._lock = threading.Lock()
+        # Learned across sessions: for each call, how often each other call came in the next round
+        self._transitions: OrderedDict[str, Counter] = OrderedDict()
+        self._results: dict[str, Future] = {}
+        self._speculative: set[str] = set()
+        self._previous_round = [_SESSION_START]
+        self._current_round = []
+
+    def start_session(self):
+        """
+        Forgets the results and rounds of the previous session. The learned transitions are kept.
+        """
+        with self._lock:
+            for future in self._results.values():
+                future.cancel()
+            self._results = {}
+            self._speculative = set()
+            self._previous_round = [_SESSION_START]
+            self._current_round = []
+
+    def predict(self) -> list[tuple[Tool, dict]]:
+        """
+        Predicts the next round's tool calls from the calls that followed the previous round's calls before.
+
+        :return: A list of (tool, arguments) pairs, most likely first, restricted to side-effect-free tools
+                 whose result isn't already available.
+        """
+        scores = Counter()
+        for key in self._previous_round:
+            scores.update(self._transitions.get(key, {}))
+
+        tools_dict = self.get_tools()
+        predictions = []
+        for key, _ in scores.most_common():
+            tool_name, arguments = json.loads(key)
+            tool = tools_dict.get(tool_name)
+            if tool is None or not tool.side_effect_free or key in self._results:
+                continue
+            predictions.append((tool, arguments))
+            if len(predictions) == self.max_predictions:
+                break
+        return predictions
+
+    def prefetch(self):
+        """
+        Starts the predicted tool calls in the background. Meant to be called right before requesting the LLM.
+        """
+        with self._lock:
+            for tool, arguments in self.predict():
+                key = call_key(tool.name, arguments)
+                self._results[key] = self._executor.submit(tool.run, **arguments)
+                self._speculative.add(key)
+                self.speculated += 1
+
+    def run(self, tool: Tool, arguments: dict):
+        """
+        Runs a tool call requested by the model, serving it from a speculative run or an earlier identical call
+        when possible.
+
+        :param tool: The tool to run.
+        :param arguments: The validated arguments of the call.
+
+        :return: The result of the tool call.
+        """
+        key = call_key(tool.name, arguments)
+        self._current_round.append(key)
+        if not tool.side_effect_free:
+            return tool.run(**arguments)
+
+        with self._lock:
+            self.lookups += 1
+            future = self._results.get(key)
+            if future is not None and future.cancelled():
+                future = None
+            if future is not None and key in self._speculative:
+                self._speculative.discard(key)
+                self.hits += 1
+            elif future is not None:
+                self.reuses += 1
+
+        if future is None:
+            result = tool.run(**arguments)
+            future = Future()
+            future.set_result(result)
+            with self._lock:
+                self._results[key] = future
+            return result
+
+        # A speculative run that failed is retried for real, so errors surface the same way as without speculation
+        if future.exception() is not None:
+            return tool.run(**arguments)
+        return future.result()
+
+    def end_round(self):
+        """
+        Learns which calls followed the previous round's calls. Meant to be called once a round's tool calls ran.
+        """
+        with self._lock:
+            for previous_key in self._previous_round:
+                successors = self._transitions.pop(previous_key, Counter())
+                successors.update(self._current_round)
+                if len(successors) > self.max_successors:
+                    successors = Counter(dict(successors.most_common(self.max_successors)))
+                self._transitions[previous_key] = successors
+            while len(self._transitions) > self.max_transitions:
+                self._transitions.popitem(last=False)
+            if self._current_round:
+                self._previous_round = self._current_round
+            self._current_round = []
+
+    def stats(self) -> dict:
+        """
+        Collects the speculation counters.
+
+        :return: A dictionary with the counters, the hit rate over side-effect-free calls and the share of
+                 speculative runs that were actually used.
+        """
+        with self._lock:
+            return {
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "reuses": self.reuses,
+                "speculated": self.speculated,
+                "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+                "precision": self.hits / self.speculated if self.speculated else 0.0,
+            }
+
+    def close(self):
+        """
+        Stops the background workers, dropping the speculative calls that didn't start yet.
+        """
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,280 @@
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import sys
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Iterable, Iterator
+
+from utils.tasks import execute_task, read_tasks
+from utils.worker_pool import AgentWorkerPool
+
+
+class Checkpoint:
+    """
+    The resumable position of a batch. Rather than every finished task, it records the line up to which the whole
+    input has been handled and the few lines above it that finished out of order, in a small file rewritten after
+    every task. Failed lines are appended to a separate log instead, and retried on the next run. The checkpoint
+    also identifies its input, so it's never applied to another one.
+
+    Attributes:
+        path: The checkpoint file, rewritten atomically after every finished task.
+        failed_path: The log of failed line numbers, `path` with a '.failed' suffix. A line succeeding on a retry
+                     is logged again with a minus sign.
+        position: Every task at or before this line number has been handled, failures excepted.
+        completed: The line numbers after `position` whose task already finished.
+        retry: The line numbers that failed in previous runs and haven't succeeded since.
+        input: The input the checkpoint belongs to: its name and a hash of its first line.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.failed_path = path + ".failed"
+        self.position = 0
+        self.completed: set[int] = set()
+        self.retry: set[int] = set()
+        self.input = None
+        self._in_flight: set[int] = set()
+
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            self.position = state["position"]
+            self.completed = set(state["completed"])
+            self.input = state.get("input")
+        self._last_read = self.position
+
+        if os.path.exists(self.failed_path):
+            with open(self.failed_path, "r", encoding="utf-8") as f:
+                for entry in f:
+                    entry = entry.strip()
+                    if not entry.lstrip("-").isdigit():
+                        # A torn last entry from an interrupted append
+                        continue
+                    line = int(entry)
+                    if line > 0:
+                        self.retry.add(line)
+                    else:
+                        self.retry.discard(-line)
+            # Start the run from a compact log, so it doesn't grow across runs
+            tmp_path = self.failed_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.writelines(f"{line}\n" for line in sorted(self.retry))
+            os.replace(tmp_path, self.failed_path)
+        self._failed_log = open(self.failed_path, "a", encoding="utf-8")
+
+    def check_input(self, name: str, first_line: str):
+        """
+        Checks that the checkpoint belongs to the given input, or binds it to that input if it's new.
+
+        :param name: The name of the input, e.g. its path.
+        :param first_line: The first line of the input.
+
+        :raises ValueError: If the checkpoint was written for another input.
+        """
+        identity = {"name": name, "first_line": hashlib.sha256(first_line.encode("utf-8")).hexdigest()}
+        if self.input is None:
+            self.input = identity
+            self.save()
+        elif self.input != identity:
+            raise ValueError(f"Checkpoint {self.path} was written for another input than {name!r} "
+                             f"(name or first line differs). Remove it or pass another checkpoint file.")
+
+    def is_pending(self, line: int) -> bool:
+        """
+        Checks whether the task of a line still has to run.
+
+        :param line: The line number of the task.
+
+        :return: True if the task failed or never finished.
+        """
+        return line in self.retry or (line > self.position and line not in self.completed)
+
+    def skip(self, line: int):
+        """
+        Records that a line was read but its task doesn't have to run.
+
+        :param line: The line number of the task.
+        """
+        self._last_read = max(self._last_read, line)
+
+    def dispatch(self, line: int):
+        """
+        Records that the task of a line was read and is about to run.
+
+        :param line: The line number of the task.
+        """
+        self._last_read = max(self._last_read, line)
+        self._in_flight.add(line)
+
+    def finish(self, line: int, succeeded: bool):
+        """
+        Records that the task of a line finished and persists the new position.
+
+        :param line: The line number of the task.
+        :param succeeded: Whether the task succeeded. Failed tasks are logged to be retried.
+        """
+        self._in_flight.discard(line)
+        if not succeeded:
+            self._failed_log.write(f"{line}\n")
+            self._failed_log.flush()
+        elif line in self.retry:
+            self.retry.discard(line)
+            self._failed_log.write(f"-{line}\n")
+            self._failed_log.flush()
+        self.completed.add(line)
+
+        # Every line before the oldest task still running has been handled
+        handled = min(self._in_flight) - 1 if self._in_flight else self._last_read
+        if handled > self.position:
+            self.position = handled
+            self.completed = {completed for completed in self.completed if completed > self.position}
+        self.save()
+
+    def save(self):
+        """
+        Writes the checkpoint, then renames it over the previous one, so an interruption never leaves it truncated.
+        """
+        state = {"input": self.input, "position": self.position, "completed": sorted(self.completed)}
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
+
+    def close(self):
+        """
+        Closes the log of failed lines.
+        """
+        self._failed_log.close()
+
+
+def run_threaded(tasks: Iterable[dict], concurrency: int) -> Iterator[dict]:
+    """
+    Runs tasks on a thread pool and yields their records as they finish.
+
+    :param tasks: An iterable of task dictionaries.
+    :param concurrency: The number of tasks run at the same time.
+
+    :return: An iterator over the output records, in completion order.
+    """
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        pending = set()
+        for task in tasks:
+            # Keep reading the input only as fast as the tasks complete
+            if len(pending) >= 2 * concurrency:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    yield future.result()
+            pending.add(executor.submit(execute_task, task))
+
+        for future in wait(pending).done:
+            yield future.result()
+
+
+def run_batch(lines, output_path: str, checkpoint_path: str, concurrency: int = 4, processes: int = 0,
+              input_name: str = "<input>") -> dict:
+    """
+    Streams tasks through the agents and writes each result as soon as it's available.
+
+    Only a bounded number of tasks are in flight at a time, so memory stays flat whatever the input size.
+    The checkpoint is updated once a result is written, and tasks it marks as handled are skipped, so an
+    interrupted batch resumes where it stopped. Failed tasks, including invalid lines, are retried on the next run.
+    A checkpoint written for another input is refused rather than applied.
+
+    :param lines: An iterable of JSONL task lines.
+    :param output_path: The JSONL file results are appended to.
+    :param checkpoint_path: The file the resumable position of the batch is saved to.
+    :param concurrency: The number of tasks run at the same time, per worker process when `processes` is set.
+    :param processes: If set, the tasks are sharded across this many worker processes instead of threads.
+    :param input_name: The name the checkpoint identifies the input by, along with its first line.
+
+    :return: A dictionary counting the succeeded, failed and skipped tasks.
+
+    :raises ValueError: If the checkpoint was written for another input.
+    """
+    lines = iter(lines)
+    first_line = next(lines, "")
+    lines = itertools.chain([first_line], lines)
+    checkpoint = Checkpoint(checkpoint_path)
+    try:
+        checkpoint.check_input(input_name, first_line)
+        return _run_pending(lines, output_path, checkpoint, concurrency, processes)
+    finally:
+        checkpoint.close()
+
+
+def _run_pending(lines, output_path: str, checkpoint: Checkpoint, concurrency: int, processes: int) -> dict:
+    """
+    A private function running the tasks a checkpoint marks as pending, see `run_batch`.
+    """
+    counts = {"succeeded": 0, "failed": 0, "skipped": 0}
+
+    def pending_tasks():
+        for task in read_tasks(lines):
+            if not checkpoint.is_pending(task["line"]):
+                checkpoint.skip(task["line"])
+                counts["skipped"] += 1
+                continue
+            checkpoint.dispatch(task["line"])
+            yield task
+
+    with open(output_path, "a", encoding="utf-8") as output:
+
+        def write(record: dict):
+            output.write(json.dumps(record) + "\n")
+            output.flush()
+            succeeded = "error" not in record
+            checkpoint.finish(record["line"], succeeded)
+            if succeeded:
+                counts["succeeded"] += 1
+                return
+            counts["failed"] += 1
+            print(f"Task {record['id']} failed: {record['error']}", file=sys.stderr)
+
+        if not processes:
+            for record in run_threaded(pending_tasks(), concurrency):
+                write(record)
+            return counts
+
+        with AgentWorkerPool(processes=processes, threads_per_worker=concurrency) as pool:
+            for record in pool.imap(pending_tasks()):
+                write(record)
+        print(f"Worker pool stats: {pool.stats()}", file=sys.stderr)
+
+    return counts
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(
+        description="Run a batch of agent tasks from a JSONL file. Each line is a task like "
+                    '{"id": "1", "agent": "react", "prompt": "...", "tools": ["module:tool"], "options": {}}.'
+    )
+    parser.add_argument("input", help="The JSONL task file, or '-' to read from stdin.")
+    parser.add_argument("-o", "--output", required=True, help="The JSONL file results are appended to.")
+    parser.add_argument("-c", "--concurrency", type=int, default=4,
+                        help="The number of tasks run at once, per worker process with --processes.")
+    parser.add_argument("-p", "--processes", type=int, default=0,
+                        help="Shard the tasks across this many worker processes. By default tasks run on threads.")
+    parser.add_argument("--checkpoint", default=None,
+                        help="The progress checkpoint file. Defaults to '<output>.checkpoint'.")
+    args = parser.parse_args(argv)
+
+    checkpoint_path = args.checkpoint or args.output + ".checkpoint"
+    try:
+        if args.input == "-":
+            counts = run_batch(sys.stdin, args.output, checkpoint_path, args.concurrency, args.processes, "<stdin>")
+        else:
+            with open(args.input, "r", encoding="utf-8") as f:
+                counts = run_batch(f, args.output, checkpoint_path, args.concurrency, args.processes,
+                                   os.path.abspath(args.input))
+    except ValueError as e:
+        parser.error(str(e))
+
+    print(f"Succeeded: {counts['succeeded']}, failed: {counts['failed']}, skipped: {counts['skipped']}",
+          file=sys.stderr)
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
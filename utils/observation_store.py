@@ -0,0 +1,230 @@
+import mmap
+import os
+import threading
+from collections import OrderedDict
+
+from ToolCalling.helper import Tool, tool
+
+
+class ObservationStore:
+    """
+    A side store for large tool results. Instead of pasting a whole table or document into the chat history,
+    where it would be resent on every later round, the agent keeps a truncated preview and a handle, and the model
+    pages through the rest with the `read_observation` tool.
+
+    Results are kept in memory, or appended to a file on disk and read back through a memory map. Either way, the
+    oldest results are evicted once their total size exceeds `max_chars`, and on disk the file is compacted once
+    evicted results take most of it.
+
+    Attributes:
+        threshold: Results longer than this number of characters are moved to the store.
+        preview_chars: The number of characters kept inline as a preview.
+        page_chars: The maximum number of characters returned by one `read_observation` call. Defaults to
+                    `threshold`.
+        path: The file the results are appended to, or None to keep them in memory. It must not exist yet: the store
+              creates it and deletes it on `close`.
+        max_chars: The maximum total number of characters kept.
+    """
+
+    # On disk, the byte offset of every block of this many characters is kept, so a page is decoded from the
+    # closest block instead of from the start of the result
+    block_chars = 65536
+
+    def __init__(self, threshold: int = 2000, preview_chars: int = 500, page_chars: int | None = None,
+                 path: str | None = None, max_chars: int = 50_000_000):
+        self.threshold = threshold
+        self.preview_chars = preview_chars
+        self.page_chars = page_chars or threshold
+        self.path = path
+        self.max_chars = max_chars
+        self._lock = threading.Lock()
+        self._counter = 0
+        self._memory: OrderedDict[str, str] = OrderedDict()
+        # handle -> (number of characters, byte offset of each block of `block_chars` characters, end byte offset)
+        self._offsets: OrderedDict[str, tuple[int, list[int], int]] = OrderedDict()
+        self._chars = 0
+        self._size = 0
+        self._live_bytes = 0
+        self._mmap = None
+
+        if path is not None:
+            # Handles are only meaningful within the store that issued them, so the file is the store's own
+            open(path, "xb").close()
+
+    def __len__(self):
+        return len(self._memory) + len(self._offsets)
+
+    def put(self, text: str) -> str:
+        """
+        Stores a text and returns the handle to read it back.
+
+        :param text: The text to store.
+
+        :return: The handle of the stored text.
+        """
+        with self._lock:
+            handle = f"obs-{self._counter}"
+            self._counter += 1
+            self._chars += len(text)
+            if self.path is None:
+                self._memory[handle] = text
+                while self._chars > self.max_chars and len(self._memory) > 1:
+                    _, evicted = self._memory.popitem(last=False)
+                    self._chars -= len(evicted)
+                return handle
+
+            blocks = []
+            start = self._size
+            with open(self.path, "ab") as f:
+                for i in range(0, len(text), self.block_chars):
+                    blocks.append(self._size)
+                    self._size += f.write(text[i:i + self.block_chars].encode("utf-8"))
+            self._offsets[handle] = (len(text), blocks, self._size)
+            self._live_bytes += self._size - start
+
+            while self._chars > self.max_chars and len(self._offsets) > 1:
+                _, (n_chars, evicted_blocks, end) = self._offsets.popitem(last=False)
+                self._chars -= n_chars
+                self._live_bytes -= end - evicted_blocks[0] if evicted_blocks else 0
+            if self._size > 2 * self._live_bytes:
+                self._compact()
+            return handle
+
+    def _compact(self):
+        """
+        A private method to rewrite the file with only the results still stored, shifting their offsets.
+        Must be called with the lock held.
+        """
+        tmp_path = self.path + ".tmp"
+        size = 0
+        with open(self.path, "rb") as src, open(tmp_path, "wb") as dst:
+            for handle, (n_chars, blocks, end) in self._offsets.items():
+                if not blocks:
+                    continue
+                src.seek(blocks[0])
+                shift = size - blocks[0]
+                size += dst.write(src.read(end - blocks[0]))
+                self._offsets[handle] = (n_chars, [block + shift for block in blocks], end + shift)
+
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        os.replace(tmp_path, self.path)
+        self._size = size
+        self._live_bytes = size
+
+    def _read_range(self, handle: str, offset: int, length: int) -> tuple[str, int]:
+        """
+        A private method to read `length` characters from `offset` of a stored text, decoding only the bytes
+        around the requested range.
+
+        :return: The characters read and the total number of characters of the stored text.
+        """
+        with self._lock:
+            if handle in self._memory:
+                text = self._memory[handle]
+                return text[offset:offset + length], len(text)
+            if handle not in self._offsets:
+                raise KeyError(f"Unknown observation handle: {handle}")
+
+            n_chars, blocks, end = self._offsets[handle]
+            if offset >= n_chars:
+                return "", n_chars
+
+            # The file only grows, so the map is refreshed when it doesn't cover the requested range anymore
+            if self._mmap is None or len(self._mmap) < end:
+                if self._mmap is not None:
+                    self._mmap.close()
+                with open(self.path, "rb") as f:
+                    self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+            first_block = offset // self.block_chars
+            last_block = min((offset + length - 1) // self.block_chars, len(blocks) - 1)
+            block_end = blocks[last_block + 1] if last_block + 1 < len(blocks) else end
+            chunk = self._mmap[blocks[first_block]:block_end].decode("utf-8")
+
+        start = offset - first_block * self.block_chars
+        return chunk[start:start + length], n_chars
+
+    def get(self, handle: str) -> str:
+        """
+        Reads back a whole stored text.
+
+        :param handle: The handle returned by `put`.
+
+        :return: The stored text.
+        """
+        with self._lock:
+            n_chars = len(self._memory[handle]) if handle in self._memory else self._offsets.get(handle, (0,))[0]
+        return self._read_range(handle, 0, n_chars)[0]
+
+    def read(self, handle: str, offset: int = 0, length: int | None = None) -> str:
+        """
+        Reads a page of a stored text.
+
+        :param handle: The handle returned by `put`.
+        :param offset: The character offset to start reading from. Negative offsets are clamped to 0.
+        :param length: The number of characters to read, capped to `page_chars`.
+
+        :return: The requested page, followed by a note telling where the next page starts if there is one.
+        """
+        offset = max(offset, 0)
+        length = self.page_chars if length is None else max(min(length, self.page_chars), 0)
+        page, n_chars = self._read_range(handle, offset, length)
+        end = offset + len(page)
+        if end < n_chars:
+            page += f"\n[{n_chars - end} more characters, continue with offset={end}]"
+        return page
+
+    def externalize(self, result):
+        """
+        Moves a tool result to the store if it's too large to be kept in the chat history.
+
+        :param result: The tool result.
+
+        :return: The result itself if it's small enough, otherwise a preview string with the handle to the rest.
+        """
+        text = str(result)
+        if len(text) <= self.threshold:
+            return result
+
+        handle = self.put(text)
+        return (f"{text[:self.preview_chars]}\n[truncated: {len(text) - self.preview_chars} more characters "
+                f"stored as '{handle}', call read_observation with handle='{handle}' and "
+                f"offset={self.preview_chars} to read them]")
+
+    def as_tool(self) -> Tool:
+        """
+        Builds the tool the model uses to page through stored results.
+
+        :return: The `read_observation` Tool bound to this store.
+        """
+        def read_observation(handle: str, offset: int, length: int) -> str:
+            """
+            Reads part of a large tool result that was truncated in a previous observation.
+
+            Args:
+                handle (str): The handle given in the truncated observation.
+                offset (int): The character offset to start reading from.
+                length (int): The number of characters to read.
+
+            Returns:
+                str: The requested characters of the stored result.
+            """
+            try:
+                return self.read(handle, offset, length)
+            except KeyError:
+                return f"No observation is stored under handle '{handle}', it may have been evicted."
+
+        return tool(read_observation)
+
+    def close(self):
+        """
+        Releases the memory map and deletes the backing file, if any.
+        """
+        with self._lock:
+            if self._mmap is not None:
+                self._mmap.close()
+                self._mmap = None
+            if self.path is not None and os.path.exists(self.path):
+                os.remove(self.path)
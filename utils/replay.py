@@ -0,0 +1,284 @@
+import gzip
+import json
+import time
+from collections import deque
+from types import SimpleNamespace
+from typing import Callable
+
+from ToolCalling.helper import Tool
+
+
+def _open_trace(path: str, mode: str):
+    """
+    Opens a trace file, transparently gzip-compressed when its name ends with '.gz'.
+
+    :param path: The path of the trace file.
+    :param mode: The text mode to open the file with ('r' or 'w').
+
+    :return: A text file object.
+    """
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def _snapshot(value):
+    """
+    Copies a value through JSON, so later mutations of the original (e.g. a growing chat history)
+    don't leak into the trace. Values JSON can't represent are stored as their string form.
+    """
+    return json.loads(json.dumps(value, default=str))
+
+
+class _RecordedResult:
+    """
+    Stands in for a recorded tool result. The agents only use tool results through their string forms, so
+    replaying both forms reproduces the exact same observations, whatever the type of the original result.
+    """
+
+    def __init__(self, repr_: str, str_: str):
+        self._repr = repr_
+        self._str = str_
+
+    def __repr__(self):
+        return self._repr
+
+    def __str__(self):
+        return self._str
+
+
+def _shared_prefix(previous: list, messages: list) -> int:
+    """
+    Counts the leading messages two requests have in common.
+    """
+    shared = 0
+    for previous_message, message in zip(previous, messages):
+        if previous_message != message:
+            break
+        shared += 1
+    return shared
+
+
+def _completion(content: str) -> SimpleNamespace:
+    """
+    Builds an object shaped like a provider response, as read by `completions_create`.
+    """
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+class _Completions:
+
+    def __init__(self, create: Callable):
+        self.create = create
+
+
+class _Chat:
+
+    def __init__(self, create: Callable):
+        self.completions = _Completions(create)
+
+
+class SessionRecorder:
+    """
+    Records every LLM request/response and every tool result of an agent session, so the session can
+    later be replayed offline with SessionReplayer.
+
+    A chat history only grows between requests, so each LLM request is stored as the number of leading messages
+    it shares with one of the last few requests, plus its new messages. The trace therefore grows with the
+    conversation rather than with its square.
+
+    Attributes:
+        path: The trace file the events are written to. A '.gz' suffix enables compression.
+        events: The recorded events, in the order they happened.
+    """
+
+    # The number of previous requests a new request is compared against, enough for agents alternating
+    # between a few chat histories like ToolAgent and ReflectionAgent
+    delta_window = 8
+
+    def __init__(self, path: str):
+        self.path = path
+        self.events = []
+        # (LLM request number, full messages) of the most recent requests
+        self._recent = deque(maxlen=self.delta_window)
+        self._llm_count = 0
+
+    def wrap_client(self, client):
+        """
+        Wraps a LLM client so its chat completions are recorded.
+
+        :param client: The LLM client to wrap.
+
+        :return: An object exposing the same 'chat.completions.create' method as the client.
+        """
+        def create(messages: list, model: str):
+            response = client.chat.completions.create(messages=messages, model=model)
+            messages = _snapshot(list(messages))
+            event = {"type": "llm", "model": model}
+            base, shared = max(((index, _shared_prefix(previous, messages)) for index, previous in self._recent),
+                               key=lambda candidate: candidate[1], default=(None, 0))
+            if shared:
+                event.update(base=base, shared=shared)
+            event.update(messages=messages[shared:], response=str(response.choices[0].message.content))
+            self.events.append(event)
+            self._recent.append((self._llm_count, messages))
+            self._llm_count += 1
+            return response
+
+        return SimpleNamespace(chat=_Chat(create))
+
+    def wrap_tool(self, tool: Tool) -> Tool:
+        """
+        Wraps a tool so its calls and results are recorded.
+
+        :param tool: The tool to wrap.
+
+        :return: A Tool with the same name and signature that records each call.
+        """
+        def fn(**kwargs):
+            result = tool.run(**kwargs)
+            self.events.append({
+                "type": "tool",
+                "name": tool.name,
+                "arguments": _snapshot(kwargs),
+                "result": {"repr": repr(result), "str": str(result)},
+            })
+            return result
+
+        return Tool(name=tool.name, fn=fn, fn_signature=tool.fn_signature)
+
+    def attach(self, agent):
+        """
+        Routes an agent's client, and its tools if it has any, through the recorder.
+
+        :param agent: A ToolAgent, ReactAgent or ReflectionAgent instance.
+
+        :return: The same agent, for chaining.
+        """
+        agent.client = self.wrap_client(agent.client)
+        if hasattr(agent, "tools"):
+            agent.tools = [self.wrap_tool(tool) for tool in agent.tools]
+            agent.tools_dict = {tool.name: tool for tool in agent.tools}
+        return agent
+
+    def save(self):
+        """
+        Writes the recorded events to the trace file, one compact JSON object per line.
+        """
+        with _open_trace(self.path, "w") as f:
+            for event in self.events:
+                f.write(json.dumps(event, separators=(",", ":")) + "\n")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.save()
+
+
+class SessionReplayer:
+    """
+    Feeds a recorded trace back through an agent without network access. Each LLM request is answered with
+    the recorded response and each tool call with the recorded result, while the requests the agent actually
+    makes are compared against the recorded ones to detect divergence.
+
+    Attributes:
+        path: The trace file to replay.
+        llm_events: The recorded LLM requests/responses, in order.
+        tool_events: The recorded tool calls/results, in order.
+        divergences: A list describing every request that didn't match the trace.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with _open_trace(path, "r") as f:
+            events = [json.loads(line) for line in f if line.strip()]
+        self.llm_events = [event for event in events if event["type"] == "llm"]
+        for event in self.llm_events:
+            # Rebuild the full request from the one it shares its leading messages with
+            if "base" in event:
+                shared_messages = self.llm_events[event.pop("base")]["messages"][:event.pop("shared")]
+                event["messages"] = shared_messages + event["messages"]
+        self.tool_events = [event for event in events if event["type"] == "tool"]
+        self.divergences = []
+        self._llm_index = 0
+        self._tool_index = 0
+
+    def _diverge(self, kind: str, index: int, expected, actual):
+        self.divergences.append({"type": kind, "index": index, "expected": expected, "actual": actual})
+
+    def _create(self, messages: list, model: str):
+        index = self._llm_index
+        if index >= len(self.llm_events):
+            self._diverge("llm", index, None, {"model": model, "messages": _snapshot(list(messages))})
+            raise RuntimeError(f"Replay trace {self.path} has no LLM response left for request #{index}")
+        self._llm_index += 1
+
+        event = self.llm_events[index]
+        actual = {"model": model, "messages": _snapshot(list(messages))}
+        expected = {"model": event["model"], "messages": event["messages"]}
+        if actual != expected:
+            self._diverge("llm", index, expected, actual)
+        return _completion(event["response"])
+
+    def replay_tool(self, tool: Tool) -> Tool:
+        """
+        Replaces a tool by one answering with the recorded results instead of running the function.
+
+        :param tool: The tool to replay.
+
+        :return: A Tool with the same name and signature that serves recorded results.
+        """
+        def fn(**kwargs):
+            index = self._tool_index
+            if index >= len(self.tool_events):
+                self._diverge("tool", index, None, {"name": tool.name, "arguments": _snapshot(kwargs)})
+                raise RuntimeError(f"Replay trace {self.path} has no tool result left for call #{index}")
+            self._tool_index += 1
+
+            event = self.tool_events[index]
+            actual = {"name": tool.name, "arguments": _snapshot(kwargs)}
+            expected = {"name": event["name"], "arguments": event["arguments"]}
+            if actual != expected:
+                self._diverge("tool", index, expected, actual)
+            return _RecordedResult(event["result"]["repr"], event["result"]["str"])
+
+        return Tool(name=tool.name, fn=fn, fn_signature=tool.fn_signature)
+
+    def attach(self, agent):
+        """
+        Replaces an agent's client, and its tools if it has any, by their replayed counterparts.
+
+        :param agent: A ToolAgent, ReactAgent or ReflectionAgent instance.
+
+        :return: The same agent, for chaining.
+        """
+        agent.client = SimpleNamespace(chat=_Chat(self._create))
+        if hasattr(agent, "tools"):
+            agent.tools = [self.replay_tool(tool) for tool in agent.tools]
+            agent.tools_dict = {tool.name: tool for tool in agent.tools}
+        return agent
+
+    def run(self, fn: Callable, *args, **kwargs) -> dict:
+        """
+        Replays a session by calling the agent entry point and timing it. Since the LLM and tools answer
+        instantly, the elapsed time is the time spent in the framework itself.
+
+        :param fn: The entry point to call, typically the `run` method of an attached agent.
+        :param args: Positional arguments passed to the entry point.
+        :param kwargs: Keyword arguments passed to the entry point.
+
+        :return: A dictionary with the result, the elapsed time, the number of replayed events, the divergences
+                 found and whether every recorded event was consumed.
+        """
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        return {
+            "result": result,
+            "elapsed": elapsed,
+            "llm_calls": self._llm_index,
+            "tool_calls": self._tool_index,
+            "divergences": self.divergences,
+            "exhausted": self._llm_index == len(self.llm_events) and self._tool_index == len(self.tool_events),
+        }
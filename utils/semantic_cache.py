@@ -0,0 +1,351 @@
+import hashlib
+import json
+import mmap
+import os
+import re
+import threading
+import zlib
+
+import numpy as np
+
+
+def hashing_vectorize(text: str, n_features: int = 1024) -> np.ndarray:
+    """
+    Embeds a text locally using the hashing trick over word unigrams, word bigrams and character trigrams.
+    No vocabulary and no network are needed, so the same text always maps to the same vector.
+
+    :param text: The text to embed.
+    :param n_features: The dimension of the resulting vector.
+
+    :return: A L2-normalized float32 vector of shape (n_features,).
+    """
+    words = re.findall(r"\w+", text.lower())
+    features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    for word in words:
+        padded = f" {word} "
+        features += [padded[i:i + 3] for i in range(len(padded) - 2)]
+
+    vector = np.zeros(n_features, dtype=np.float32)
+    if not features:
+        return vector
+
+    hashes = np.fromiter((zlib.crc32(f.encode("utf-8")) for f in features), dtype=np.uint32, count=len(features))
+    # The top bit decides the sign, so colliding features tend to cancel out instead of piling up
+    signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+    np.add.at(vector, hashes % n_features, signs)
+
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def context_key(*parts: str) -> int:
+    """
+    Hashes the configuration a cached answer depends on (e.g. model, system prompt and tool signatures), so
+    agents configured differently never serve each other's answers.
+
+    :param parts: The configuration strings.
+
+    :return: A signed 64-bit integer identifying the configuration.
+    """
+    digest = hashlib.blake2b("\x00".join(parts).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little", signed=True)
+
+
+# Words that can be added, dropped or contracted without changing what a query asks for
+_STOPWORDS = frozenset("""
+    a an the this that these those it its i me my we our you your he she they them their
+    is are was were be been being am do does did can could would will shall should may might must
+    s t d ll re ve m whats what s how hows when where which who whom why
+    of to in on at by for from with about into over under as and or but if then so than
+    please kindly just tell give show let us
+""".split())
+
+_NUMBER_WORDS = frozenset("""
+    zero one two three four five six seven eight nine ten eleven twelve thirteen fourteen fifteen sixteen
+    seventeen eighteen nineteen twenty thirty forty fifty sixty seventy eighty ninety hundred thousand million
+    billion trillion
+""".split())
+
+
+def terms_key(text: str) -> int:
+    """
+    Hashes what a query asks about: its numbers, in order, and the set of its other non-stopword words.
+    Embeddings of queries that differ in a single number or name are very close, so a cached answer is only
+    served to a query with the same terms key.
+
+    :param text: The query.
+
+    :return: A signed 64-bit integer identifying the terms of the query.
+    """
+    words = re.findall(r"\w+", text.lower())
+    numbers = [word for word in words if word.isdigit() or word in _NUMBER_WORDS]
+    others = {word for word in words if word not in _STOPWORDS and word not in _NUMBER_WORDS and not word.isdigit()}
+    return context_key(" ".join(numbers), " ".join(sorted(others)))
+
+
+
+
+class SemanticCache:
+    """
+    A bounded response cache that matches near-duplicate queries by cosine similarity of their hashed embeddings.
+    Embeddings live in a (memory-mapped) matrix, so a lookup is a single matrix-vector product, and the
+    least recently used entry is evicted once the cache is full. A similar query is only served if it asks about
+    the same numbers and words, see `terms_key`.
+
+    When persisted, each slot's vector, keys, ticks and answer location live in fixed-size memory-mapped arrays,
+    and the answers are appended to a data file, which is compacted once most of it is superseded. Opening the
+    cache reads nothing but the arrays' sizes, and an answer is only read and decoded when it's served.
+
+    Attributes:
+        capacity: The maximum number of cached responses.
+        threshold: The minimum cosine similarity for a cached response to be returned.
+        n_features: The dimension of the embeddings.
+        path: The directory where the cache is persisted, or None to keep it in memory.
+        hits: The number of lookups served from the cache.
+        misses: The number of lookups that found no similar enough entry.
+    """
+
+    def __init__(self, capacity: int = 1024, threshold: float = 0.8, n_features: int = 1024,
+                 path: str | None = None):
+        self.capacity = capacity
+        self.threshold = threshold
+        self.n_features = n_features
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # Serializes the appends and compactions of the data file, so they never hold up lookups
+        self._data_lock = threading.Lock()
+
+        if path is None:
+            self._answers: list[str | None] = [None] * capacity
+            self._vectors = np.zeros((capacity, n_features), dtype=np.float32)
+            # Per slot: access tick, write tick, context key, query key and terms key
+            self._meta = np.zeros((capacity, 5), dtype=np.int64)
+            self._clock = 0
+            return
+
+        os.makedirs(path, exist_ok=True)
+        self._vectors = self._open_array("vectors.f32", np.float32, (capacity, n_features))
+        self._meta = self._open_array("meta.i64", np.int64, (capacity, 5))
+        # Per slot: byte offset and byte length of its record in the data file
+        self._locations = self._open_array("locations.i64", np.int64, (capacity, 2))
+        self._mmap = None
+        with open(self._data_path, "ab") as f:
+            self._data_size = f.tell()
+        self._clock = int(self._meta[:, :2].max(initial=0))
+
+    @property
+    def _data_path(self) -> str:
+        return os.path.join(self.path, "answers.dat")
+
+    @property
+    def _last_used(self) -> np.ndarray:
+        return self._meta[:, 0]
+
+    @property
+    def _written(self) -> np.ndarray:
+        return self._meta[:, 1]
+
+    @property
+    def _contexts(self) -> np.ndarray:
+        return self._meta[:, 2]
+
+    @property
+    def _query_keys(self) -> np.ndarray:
+        return self._meta[:, 3]
+
+    @property
+    def _terms(self) -> np.ndarray:
+        return self._meta[:, 4]
+
+    def _open_array(self, name: str, dtype, shape: tuple) -> np.memmap:
+        """
+        A private method to open (or create) one of the fixed-size memory-mapped arrays of the cache.
+        """
+        array_path = os.path.join(self.path, name)
+        if not os.path.exists(array_path):
+            return np.memmap(array_path, dtype=dtype, mode="w+", shape=shape)
+        if os.path.getsize(array_path) != np.dtype(dtype).itemsize * int(np.prod(shape)):
+            raise ValueError(f"Semantic cache at {self.path} was created with a different capacity or n_features")
+        return np.memmap(array_path, dtype=dtype, mode="r+", shape=shape)
+
+    def _read_answer(self, slot: int) -> str | None:
+        """
+        A private method to read and decode the answer of a slot. The record carries the write tick of the slot, so
+        a record that doesn't match it (the process stopped between the two writes) is treated as missing.
+        Must be called with the lock held.
+        """
+        if self.path is None:
+            return self._answers[slot]
+
+        offset, length = (int(value) for value in self._locations[slot])
+        if offset + length > self._data_size:
+            return None
+        # The data file only grows between compactions, so the map is refreshed when it doesn't cover the record
+        if self._mmap is None or len(self._mmap) < offset + length:
+            if self._mmap is not None:
+                self._mmap.close()
+            with open(self._data_path, "rb") as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            record = json.loads(self._mmap[offset:offset + length])
+        except ValueError:
+            return None
+        return record["answer"] if record["written"] == self._written[slot] else None
+
+    def _append_record(self, record: dict) -> tuple[int, int]:
+        """
+        A private method to append a record to the data file. Must be called with the data lock held.
+
+        :return: The byte offset and byte length of the record.
+        """
+        data = (json.dumps(record) + "\n").encode("utf-8")
+        with open(self._data_path, "ab") as f:
+            f.write(data)
+        offset = self._data_size
+        self._data_size += len(data)
+        return offset, len(data)
+
+    def _compact(self):
+        """
+        A private method to rewrite the data file with only the live records, once they take less than a quarter
+        of it. Must be called with the data lock held, so no record is appended meanwhile.
+        """
+        with self._lock:
+            live = np.flatnonzero(self._written != 0)
+            live_bytes = int(self._locations[live, 1].sum())
+            if self._data_size <= 4 * max(live_bytes, 1 << 20):
+                return
+            locations = self._locations[live].copy()
+
+        # Write then rename, so an interrupted compaction never loses the data file
+        tmp_path = self._data_path + ".tmp"
+        new_locations = np.zeros_like(locations)
+        size = 0
+        with open(self._data_path, "rb") as src, open(tmp_path, "wb") as dst:
+            for i, (offset, length) in enumerate(locations):
+                src.seek(int(offset))
+                new_locations[i] = (size, length)
+                size += dst.write(src.read(int(length)))
+
+        with self._lock:
+            if self._mmap is not None:
+                self._mmap.close()
+                self._mmap = None
+            os.replace(tmp_path, self._data_path)
+            # No slot was rewritten while copying, since `put` holds the data lock for the whole write
+            self._locations[live] = new_locations
+            self._data_size = size
+
+    def get(self, query: str, context: int = 0) -> str | None:
+        """
+        Looks up the cached response of the most similar previous query.
+
+        :param query: The user message.
+        :param context: The configuration the answer must have been produced with, see `context_key`.
+
+        :return: The cached response if its query is at least `threshold` similar and asks about the same terms,
+                 None otherwise.
+        """
+        vector = hashing_vectorize(query, self.n_features)
+        terms = terms_key(query)
+        with self._lock:
+            scores = self._vectors @ vector
+            scores[(self._written == 0) | (self._contexts != context) | (self._terms != terms)] = -np.inf
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+            answer = self._read_answer(best)
+            if answer is None:
+                self._written[best] = 0
+                self._last_used[best] = 0
+                self.misses += 1
+                return None
+            self._clock += 1
+            self._last_used[best] = self._clock
+            self.hits += 1
+            return answer
+
+    def put(self, query: str, answer: str, context: int = 0):
+        """
+        Caches the response to a query, evicting the least recently used entry if the cache is full.
+
+        :param query: The user message.
+        :param answer: The response produced for that message.
+        :param context: The configuration the answer was produced with, see `context_key`.
+        """
+        vector = hashing_vectorize(query, self.n_features)
+        keys = (context, context_key(query), terms_key(query))
+        with self._data_lock:
+            with self._lock:
+                same_query = np.flatnonzero((self._written != 0) & (self._contexts == keys[0])
+                                            & (self._query_keys == keys[1]))
+                # Free slots have never been used, so their tick of 0 makes them the first pick
+                slot = int(same_query[0]) if len(same_query) else int(np.argmin(self._last_used))
+                self._clock += 1
+                written = self._clock
+
+            if self.path is not None:
+                # The record is appended before the slot points to it, and lookups don't wait for the write
+                location = self._append_record({"written": written, "answer": answer})
+
+            with self._lock:
+                self._vectors[slot] = vector
+                self._meta[slot] = (written, written, *keys)
+                if self.path is None:
+                    self._answers[slot] = answer
+                else:
+                    self._locations[slot] = location
+
+            if self.path is not None:
+                self._compact()
+
+    def stats(self) -> dict:
+        """
+        Collects the cache counters.
+
+        :return: A dictionary with the number of entries, hits, misses and the hit rate.
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": int(np.count_nonzero(self._written)),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+    def close(self):
+        """
+        Flushes the memory-mapped arrays to disk and releases the map of the data file. Does nothing for an
+        in-memory cache.
+        """
+        if self.path is None:
+            return
+        with self._lock:
+            for array in (self._vectors, self._meta, self._locations):
+                array.flush()
+            if self._mmap is not None:
+                self._mmap.close()
+                self._mmap = None
+
+
+if __name__ == "__main__":
+    # Queries differing in a single number or name must not share an answer, paraphrases should
+    cache = SemanticCache()
+    cache.put("Please add 3 and 5", "3 + 5 = 8")
+    assert cache.get("Please add 3 and 7") is None
+    assert cache.get("Please add 5 and 3") is None
+    assert cache.get("Could you please add 3 and 5?") == "3 + 5 = 8"
+
+    react_msg = ("I want to calculate the sum of 1234 and 5678 and multiply the result by 5. "
+                 "Then, I want to take the logarithm of this result")
+    cache.put(react_msg, "9.4")
+    assert cache.get(react_msg.replace("by 5", "by 6")) is None
+
+    cache.put("What is the sum of 3 and 5", "8")
+    assert cache.get("What's the sum of 3 and 5?") == "8"
+    assert cache.get("What is the sum of 3 and 5 apples") is None
+    print(cache.stats())
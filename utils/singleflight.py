@@ -0,0 +1,152 @@
+import hashlib
+import json
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+from utils.completions import completions_create
+
+
+@dataclass
+class _Call:
+    """
+    A data class to represent a single in-flight call shared by every caller with the same key.
+
+    Attributes:
+        done: An event set once the underlying call has finished.
+        result: The value returned by the underlying call.
+        error: The exception raised by the underlying call, if any.
+        waiters: The number of callers that joined the call instead of issuing their own.
+    """
+    done: threading.Event = field(default_factory=threading.Event)
+    result: Any = None
+    error: BaseException | None = None
+    waiters: int = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share the same key into a single execution. The first caller
+    runs the function, every other caller arriving while it is still in flight waits for it and
+    receives the same result (or the same exception).
+
+    Attributes:
+        calls: The number of times the underlying function was actually executed.
+        saved: The number of calls that were served by joining an in-flight call.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight: dict[str, _Call] = {}
+        self.calls = 0
+        self.saved = 0
+
+    def do(self, key: str, fn: Callable, *args, **kwargs):
+        """
+        Executes `fn` unless a call with the same key is already in flight, in which case it waits for
+        that call and returns its result.
+
+        :param key: The key identifying identical calls.
+        :param fn: The function to execute.
+        :param args: Positional arguments passed to the function.
+        :param kwargs: Keyword arguments passed to the function.
+
+        :return: The result of the (possibly shared) function call.
+        """
+        with self._lock:
+            call = self._in_flight.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.saved += 1
+                leader = False
+            else:
+                call = _Call()
+                self._in_flight[key] = call
+                self.calls += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            # Forget the key before waking the waiters, so later callers trigger a fresh request
+            with self._lock:
+                del self._in_flight[key]
+            call.done.set()
+        return call.result
+
+    def stats(self) -> dict:
+        """
+        Collects the coalescing counters.
+
+        :return: A dictionary with the number of executed calls, saved calls and the share of requests saved.
+        """
+        with self._lock:
+            total = self.calls + self.saved
+            return {
+                "calls": self.calls,
+                "saved": self.saved,
+                "saved_ratio": self.saved / total if total else 0.0,
+            }
+
+
+def client_identity(client) -> str:
+    """
+    Identifies the provider configuration of a LLM client, so requests are only coalesced between clients that
+    would send them with the same credentials. Clients exposing their `provider_configs` (like aisuite's) are
+    identified by them, which lets separately built agents with the same configuration share calls. Any other
+    client is only identical to itself.
+
+    :param client: The LLM client.
+
+    :return: A string identifying the client configuration.
+    """
+    provider_configs = getattr(client, "provider_configs", None)
+    if provider_configs is None:
+        return f"{type(client).__qualname__}:{id(client)}"
+    return f"{type(client).__qualname__}:{json.dumps(provider_configs, sort_keys=True, default=str)}"
+
+
+def request_key(client, messages: list, model: str) -> str:
+    """
+    Hashes a completion request so identical requests map to the same key.
+
+    :param client: The LLM client sending the request.
+    :param messages: A list of message objects containing chat history for the model.
+    :param model: The model to use for generating responses.
+
+    :return: A hex digest identifying the request.
+    """
+    payload = json.dumps({"client": client_identity(client), "model": model, "messages": list(messages)},
+                         sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# Shared by every caller of `coalesced_completions_create` that doesn't bring its own group
+default_group = SingleFlight()
+
+
+def coalesced_completions_create(client, messages: list, model: str, group: SingleFlight | None = None) -> str:
+    """
+    Drop-in replacement for `completions_create` that shares one provider call between all concurrent
+    callers sending the same model and messages through the same client configuration.
+
+    :param client: The LLM client
+    :param messages: A list of message objects containing chat history for the model.
+    :param model: The model to use for generating tool calls and responses.
+    :param group: The SingleFlight group used to coalesce requests. Defaults to the module-level group.
+
+    :return: The content of the model's response.
+    """
+    group = group if group is not None else default_group
+    # Snapshot the history: callers keep appending to their own list while the request is in flight
+    messages = list(messages)
+    return group.do(request_key(client, messages, model), completions_create, client, messages, model)
@@ -0,0 +1,123 @@
+import importlib
+import json
+import time
+from typing import Iterable, Iterator
+
+from Planning.agent import ReactAgent
+from Reflection.agent import ReflectionAgent
+from ToolCalling.agent import ToolAgent
+from ToolCalling.helper import Tool
+
+
+AGENT_TYPES = {
+    "tool": ToolAgent,
+    "react": ReactAgent,
+    "reflection": ReflectionAgent,
+}
+
+
+def load_tool(path: str) -> Tool:
+    """
+    Imports a tool from its import path.
+
+    :param path: The import path of the tool, as 'package.module:attribute'.
+
+    :return: The Tool instance found at that path.
+    """
+    module_name, _, attribute = path.partition(":")
+    if not attribute:
+        raise ValueError(f"Tool path must look like 'package.module:attribute', got: {path}")
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+def build_agent(agent_type: str, model: str | None = None, tools: list[str] | None = None, **agent_options):
+    """
+    Builds an agent from its type name.
+
+    :param agent_type: One of the keys of AGENT_TYPES ('tool', 'react' or 'reflection').
+    :param model: The model used by the agent. Defaults to the agent's own default.
+    :param tools: The import paths of the tools given to a tool or react agent.
+    :param agent_options: Extra keyword arguments passed to the agent constructor.
+
+    :return: The agent instance.
+    """
+    if agent_type not in AGENT_TYPES:
+        raise ValueError(f"Unknown agent type: {agent_type}. Expected one of {sorted(AGENT_TYPES)}")
+    if model is not None:
+        agent_options["model"] = model
+    if agent_type != "reflection":
+        agent_options["tools"] = [load_tool(path) for path in tools or []]
+    return AGENT_TYPES[agent_type](**agent_options)
+
+
+def read_tasks(lines: Iterable[str]) -> Iterator[dict]:
+    """
+    Lazily parses tasks from JSONL lines, one task at a time, so the input is never held in memory.
+    Each task gets its 'line' number, and tasks without an 'id' get their line number as id, which stays stable
+    when the same input is read again. Ids are always strings.
+
+    A line that isn't a valid task doesn't stop the input: it's yielded as a task carrying an 'error', which
+    `execute_task` reports as failed.
+
+    :param lines: An iterable of JSONL lines, e.g. an open file or sys.stdin.
+
+    :return: An iterator over the task dictionaries.
+    """
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            task = json.loads(line)
+            if not isinstance(task, dict):
+                raise ValueError(f"expected a JSON object, got {type(task).__name__}")
+        except ValueError as e:
+            yield {"id": str(line_number), "line": line_number, "error": f"Invalid task line: {e}"}
+            continue
+        task["id"] = str(task.get("id", line_number))
+        task["line"] = line_number
+        yield task
+
+
+def run_task(task: dict, agent=None):
+    """
+    Runs a single task.
+
+    A task is a dictionary with the following keys:
+    - agent: The agent type ('tool', 'react' or 'reflection').
+    - prompt: The user message.
+    - model: Optional, the model used by the agent.
+    - tools: Optional, the import paths of the tools given to a tool or react agent.
+    - agent_options: Optional, extra keyword arguments passed to the agent constructor.
+    - options: Optional, extra keyword arguments passed to the agent `run` method (e.g. max_rounds, n_steps).
+
+    :param task: The task dictionary.
+    :param agent: An already built agent to reuse. If None, an agent is built from the task.
+
+    :return: The agent's final response.
+    """
+    if agent is None:
+        agent = build_agent(task["agent"], task.get("model"), task.get("tools"), **task.get("agent_options", {}))
+    return agent.run(user_msg=task["prompt"], **task.get("options", {}))
+
+
+def execute_task(task: dict, agent=None) -> dict:
+    """
+    Runs a task and turns its outcome into an output record. Failures are reported, not raised, so one bad
+    task doesn't stop a batch.
+
+    :param task: The task dictionary.
+    :param agent: An already built agent to reuse. If None, an agent is built from the task.
+
+    :return: A dictionary with the task id, agent type, elapsed time and either the output or the error.
+    """
+    start = time.perf_counter()
+    record = {"id": task["id"], "line": task.get("line"), "agent": task.get("agent")}
+    if "error" in task:
+        record.update(error=task["error"], elapsed=0.0)
+        return record
+    try:
+        record["output"] = run_task(task, agent)
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+    record["elapsed"] = time.perf_counter() - start
+    return record
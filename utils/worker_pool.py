@@ -0,0 +1,272 @@
+import json
+import multiprocessing
+import os
+import queue
+import statistics
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator
+
+from utils.tasks import build_agent, execute_task
+
+
+def _agent_key(task: dict) -> str:
+    """
+    Identifies the agent configuration a task needs, so tasks sharing it reuse the same warm agent.
+    """
+    return json.dumps([task.get("agent"), task.get("model"), task.get("tools"), task.get("agent_options", {})],
+                      sort_keys=True)
+
+
+def _worker_thread(task_queue, result_queue):
+    """
+    Consumes (sequence number, task) pairs until it receives None. Each thread keeps its own agents, with their
+    client and tool registry, so nothing is rebuilt between tasks and no agent is shared between threads.
+    """
+    agents = {}
+    while True:
+        item = task_queue.get()
+        if item is None:
+            break
+        seq, task = item
+        try:
+            key = _agent_key(task)
+            if key not in agents and "error" not in task:
+                agents[key] = build_agent(task["agent"], task.get("model"), task.get("tools"),
+                                          **task.get("agent_options", {}))
+            record = execute_task(task, agents.get(key))
+        except Exception as e:
+            record = {"id": task["id"], "line": task.get("line"), "agent": task.get("agent"),
+                      "error": f"{type(e).__name__}: {e}", "elapsed": 0.0}
+        record["worker"] = os.getpid()
+        result_queue.put((seq, record))
+
+    for agent in agents.values():
+        if hasattr(agent, "close"):
+            agent.close()
+
+
+def _worker(task_queue, result_queue, threads: int):
+    """
+    The entry point of a worker process. Several threads let one process overlap the network waits of its
+    sessions, while the CPU-side work of different processes runs in parallel.
+    """
+    workers = [threading.Thread(target=_worker_thread, args=(task_queue, result_queue)) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+@dataclass
+class _WorkerHandle:
+    """
+    A data class to represent a worker process and the tasks it was given.
+
+    Attributes:
+        process: The worker process.
+        task_queue: The queue the worker reads its tasks from.
+        tasks: The tasks sent to the worker and not finished yet, by sequence number, with their submission time.
+    """
+    process: multiprocessing.Process
+    task_queue: multiprocessing.Queue
+    tasks: dict[int, tuple[dict, float]] = field(default_factory=dict)
+
+
+class AgentWorkerPool:
+    """
+    Shards agent sessions across processes, so the Python-side work of ToolAgent, ReactAgent and ReflectionAgent
+    (prompt assembly, tag extraction, JSON parsing, validation and local tools) isn't capped by a single GIL.
+    Tasks are the dictionaries described in `utils.tasks.run_task`. Each worker has its own local queue, so the
+    pool knows which tasks a worker holds: if the worker dies, they are reported as failed and the worker is
+    restarted.
+
+    Attributes:
+        processes: The number of worker processes. Defaults to the number of cores.
+        threads_per_worker: The number of sessions each worker process runs at the same time.
+        max_pending: The maximum number of tasks queued or running at once.
+        poll_interval: How often, in seconds, the workers are checked while waiting for results.
+        completed: The number of tasks that succeeded.
+        failed: The number of tasks that failed.
+        restarts: The number of workers restarted after dying.
+    """
+
+    def __init__(self, processes: int | None = None, threads_per_worker: int = 1, max_pending: int | None = None,
+                 latency_window: int = 10000, poll_interval: float = 1.0):
+        self.processes = processes or os.cpu_count() or 1
+        self.threads_per_worker = threads_per_worker
+        self.max_pending = max_pending or 2 * self.processes * threads_per_worker
+        self.poll_interval = poll_interval
+        self.completed = 0
+        self.failed = 0
+        self.restarts = 0
+        # Only the most recent latencies are kept, so long batches don't grow the pool's memory
+        self._latencies = deque(maxlen=latency_window)
+        self._per_worker = {}
+        self._started_at = None
+        self._result_queue = multiprocessing.Queue()
+        self._workers: list[_WorkerHandle] = []
+        self._owners: dict[int, _WorkerHandle] = {}
+        self._lost = deque()
+        self._seq = 0
+
+    def _spawn(self) -> _WorkerHandle:
+        """
+        A private method to start a worker process with its own task queue.
+        """
+        task_queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=_worker, args=(task_queue, self._result_queue,
+                                                                self.threads_per_worker), daemon=True)
+        process.start()
+        return _WorkerHandle(process=process, task_queue=task_queue)
+
+    def start(self):
+        """
+        Starts the worker processes.
+        """
+        self._started_at = time.perf_counter()
+        self._workers = [self._spawn() for _ in range(self.processes)]
+
+    def close(self, terminate: bool = False):
+        """
+        Stops the workers. By default they first finish the tasks they were given; with `terminate` they are
+        killed right away. Results still queued are discarded, so a worker blocked on flushing them can exit.
+
+        :param terminate: Whether to kill the workers instead of letting them finish.
+        """
+        for handle in self._workers:
+            if terminate:
+                handle.process.terminate()
+            else:
+                for _ in range(self.threads_per_worker):
+                    handle.task_queue.put(None)
+
+        while any(handle.process.is_alive() for handle in self._workers):
+            try:
+                self._result_queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        for handle in self._workers:
+            handle.process.join()
+            handle.task_queue.close()
+        self._workers = []
+        self._owners = {}
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(terminate=exc_type is not None)
+
+    def submit(self, task: dict):
+        """
+        Sends a task to the worker holding the fewest tasks.
+
+        :param task: The task dictionary.
+        """
+        handle = min(self._workers, key=lambda worker: len(worker.tasks))
+        seq = self._seq
+        self._seq += 1
+        handle.tasks[seq] = (task, time.perf_counter())
+        self._owners[seq] = handle
+        handle.task_queue.put((seq, task))
+
+    def _check_workers(self):
+        """
+        A private method to detect dead workers. Their unfinished tasks are reported as failed and a new worker
+        takes their place.
+        """
+        for i, handle in enumerate(self._workers):
+            if handle.process.is_alive():
+                continue
+            pid, exitcode = handle.process.pid, handle.process.exitcode
+            for seq, (task, submitted_at) in handle.tasks.items():
+                del self._owners[seq]
+                self._lost.append({
+                    "id": task["id"], "line": task.get("line"), "agent": task.get("agent"),
+                    "error": f"WorkerDied: worker {pid} exited with code {exitcode}",
+                    "elapsed": time.perf_counter() - submitted_at, "worker": pid,
+                })
+            handle.task_queue.close()
+            self._workers[i] = self._spawn()
+            self.restarts += 1
+
+    def _collect(self) -> dict:
+        """
+        A private method to wait for the next result and account for it in the metrics.
+        """
+        while True:
+            if self._lost:
+                record = self._lost.popleft()
+                break
+            try:
+                seq, record = self._result_queue.get(timeout=self.poll_interval)
+            except queue.Empty:
+                self._check_workers()
+                continue
+            handle = self._owners.pop(seq, None)
+            if handle is None:
+                # Late result of a task already reported as lost with its worker
+                continue
+            del handle.tasks[seq]
+            break
+
+        if "error" in record:
+            self.failed += 1
+        else:
+            self.completed += 1
+        self._latencies.append(record["elapsed"])
+        self._per_worker[record["worker"]] = self._per_worker.get(record["worker"], 0) + 1
+        return record
+
+    def imap(self, tasks: Iterable[dict]) -> Iterator[dict]:
+        """
+        Runs tasks on the workers and yields their records as they finish, in completion order. The input is
+        consumed only as fast as the tasks complete, so it can be arbitrarily large.
+
+        :param tasks: An iterable of task dictionaries.
+
+        :return: An iterator over the output records, see `utils.tasks.execute_task`.
+        """
+        in_flight = 0
+        for task in tasks:
+            if in_flight >= self.max_pending:
+                yield self._collect()
+                in_flight -= 1
+            self.submit(task)
+            in_flight += 1
+
+        while in_flight:
+            yield self._collect()
+            in_flight -= 1
+
+    def stats(self) -> dict:
+        """
+        Aggregates the throughput and latency metrics of every worker.
+
+        :return: A dictionary with the task counts, throughput in tasks per second, latency percentiles in seconds
+                 over the most recent tasks, the number of restarted workers and the number of tasks handled by each
+                 worker process.
+        """
+        elapsed = time.perf_counter() - self._started_at if self._started_at is not None else 0.0
+        finished = self.completed + self.failed
+        latencies = sorted(self._latencies)
+
+        def percentile(q: float) -> float:
+            return latencies[min(int(q * len(latencies)), len(latencies) - 1)] if latencies else 0.0
+
+        return {
+            "completed": self.completed,
+            "failed": self.failed,
+            "restarts": self.restarts,
+            "elapsed": elapsed,
+            "throughput": finished / elapsed if elapsed else 0.0,
+            "latency_mean": statistics.fmean(latencies) if latencies else 0.0,
+            "latency_p50": percentile(0.5),
+            "latency_p95": percentile(0.95),
+            "latency_max": latencies[-1] if latencies else 0.0,
+            "per_worker": dict(self._per_worker),
+        }